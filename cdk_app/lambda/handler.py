@@ -1,93 +1,167 @@
 import os
 import json
-import boto3
-import uuid
+from secrets import token_hex
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
-sagemaker = boto3.client("sagemaker")
-dynamodb = boto3.resource("dynamodb")
-stepfunctions_client = boto3.client("stepfunctions")
+# botocore is imported on the first real request rather than at module load,
+# so warm-up pings never pay for loading it (provisioned instances are the
+# exception, see below).
+@lru_cache(maxsize=None)
+def _botocore():
+    import botocore.session
+    from botocore.config import Config
+    # Two attempts instead of the default retry loop keeps tail latency bounded;
+    # callers (Step Functions, API clients) already retry on their own. Adaptive
+    # mode also rate-limits client-side when a service starts throttling.
+    # No client ever has more than one request in flight (the executor only
+    # overlaps calls to different services), so two pooled sockets suffice.
+    config = Config(
+        tcp_keepalive=True,
+        connect_timeout=1,
+        read_timeout=3,
+        max_pool_connections=2,
+        retries={"max_attempts": 2, "mode": "adaptive"}
+    )
+    # One botocore session shared by every client: credentials, endpoint data and
+    # service models are resolved once per container.
+    return botocore.session.get_session(), config
+
+def _create_client(service_name, **config_overrides):
+    session, config = _botocore()
+    if config_overrides:
+        from botocore.config import Config
+        config = config.merge(Config(**config_overrides))
+    return session.create_client(service_name, config=config)
+
+# Clients are built on first use so a cold container only pays for the
+# services the route it serves actually needs.
+@lru_cache(maxsize=None)
+def sagemaker_client():
+    # Same-region control plane: fail fast instead of waiting out the 60s defaults
+    return _create_client("sagemaker", connect_timeout=2, read_timeout=5)
+
+# Low-level client: items are passed as pre-serialized AttributeValue dicts,
+# skipping the resource layer's Table() construction and TypeSerializer pass.
+@lru_cache(maxsize=None)
+def dynamodb_client():
+    return _create_client("dynamodb")
+
+@lru_cache(maxsize=None)
+def stepfunctions_client():
+    return _create_client("stepfunctions")
+
+# Provisioned instances are initialised before any request arrives, so they
+# pay for botocore and every client at load time instead of on their first
+# /start, /stop or stage call. On-demand initialisations stay lazy.
+if os.environ.get("AWS_LAMBDA_INITIALIZATION_TYPE") == "provisioned-concurrency":
+    dynamodb_client()
+    stepfunctions_client()
+    sagemaker_client()
+
+TABLE_NAME = os.environ["STATUS_TABLE"]
+OUTPUT_BUCKET = os.environ["OUTPUT_BUCKET"]
+ROLE_ARN = os.environ["SAGEMAKER_ROLE_ARN"]
+RECON_BUCKET = "gabe-recon-renderingpipeline-bucket"
+ACCOUNT_ID = "975050048887"
+REGION = "us-west-2"
+STATE_MACHINE_ARN = f"arn:aws:states:{REGION}:{ACCOUNT_ID}:stateMachine:RenderingPipelineStateMachine39265931-vs5WJJdof6SW"
+# Executions are named after their jobId, which makes the execution ARN known
+# before start_execution returns
+_EXECUTION_ARN_PREFIX = STATE_MACHINE_ARN.replace(":stateMachine:", ":execution:") + ":"
+# Constant URI prefixes; per-request URIs are built by plain concatenation
+_ECR_PREFIX = f"{ACCOUNT_ID}.dkr.ecr.{REGION}.amazonaws.com/"
+_ECR_SUFFIX = ":latest"
+_USER_SUBMISSIONS_PREFIX = "s3://user-submissions/"
+_RECON_OUTPUT_URI = f"s3://{RECON_BUCKET}/recon-outputs/"
+_MODEL_OUTPUT_URI = f"s3://{OUTPUT_BUCKET}/models/"
+
+# CreateTrainingJob fields that are identical for every stage. Shared, so
+# never mutate the nested dicts.
+_TRAINING_JOB_TEMPLATE = {
+    "RoleArn": ROLE_ARN,
+    "ResourceConfig": {
+        "InstanceType": "ml.p3.2xlarge",
+        "InstanceCount": 1,
+        "VolumeSizeInGB": 50
+    },
+    "StoppingCondition": {"MaxRuntimeInSeconds": 3600}
+}
+
+_CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Headers": "*",
+    "Access-Control-Allow-Methods": "*"
+}
+
+# Reused across warm invocations to overlap independent AWS calls
+_EXECUTOR = ThreadPoolExecutor(max_workers=2)
+
+_BAD_REQUEST = {
+    "statusCode": 400,
+    "body": json.dumps({"error": "Invalid route or method."})
+}
 
 def handler(event, context):
+    # Scheduled keep-warm pings only need the container, not any AWS calls
+    if event.get("source") == "aws.events":
+        return {"statusCode": 200}
+    return route_event(event)
+
+def _parse_body(event):
+    # API Gateway wraps the payload in a JSON "body"; direct invocations pass it as-is.
+    # Raises ValueError on malformed JSON.
+    if "body" not in event:
+        return event
+    raw = event["body"]
+    return json.loads(raw) if raw else {}
+
+def route_event(event):
     # If invoked by Step Functions, we won't have the same "path" logic:
     # We'll parse "action" from event["action"] if it exists.
     if "action" in event:
         # Called from Step Functions
         action = event["action"]
         return do_stage_logic(event, action)
-    else:
-        # Otherwise, fallback to the API Gateway route-based logic
-        path = event.get("requestContext", {}).get("resourcePath")
-        method = event.get("httpMethod")
-        if path == "/stop" and method == "POST":
-            return stop_job_logic(event)
-        elif path == "/start" and method == "POST":
-            return start_job_logic(event)
-        else:
-            return {
-                "statusCode": 400,
-                "body": json.dumps({"error": "Invalid route or method."})
-            }
+    # Otherwise, fallback to the API Gateway route-based logic. HTTP API (v2)
+    # events carry the matched route as e.g. "POST /start".
+    route_handler = _ROUTES.get(event.get("routeKey"))
+    return route_handler(event) if route_handler else _BAD_REQUEST
 
 def do_stage_logic(event, action):
-    if action == "UPDATE_TOKEN":
-        table_name = os.environ["STATUS_TABLE"]
-        table = dynamodb.Table(table_name)
-        # Expecting jobId and taskToken in the event
-        job_id = event.get("jobId")
-        task_token = event.get("taskToken")
-        if job_id and task_token:
-            table.update_item(
-                Key={"jobId": job_id},
-                UpdateExpression="SET taskToken = :token",
-                ExpressionAttributeValues={":token": task_token}
-            )
-            return {
-                "statusCode": 200,
-                "body": json.dumps({"message": "Task token updated", "jobId": job_id})
-            }
-        else:
-            return {
-                "statusCode": 400,
-                "body": json.dumps({"error": "Missing jobId or taskToken"})
-            }
-    # Otherwise, proceed with the regular RECON/ TRAIN logic:
-    table_name = os.environ["STATUS_TABLE"]
-    role_arn = os.environ["SAGEMAKER_ROLE_ARN"]
-    recon_bucket_name = "gabe-recon-renderingpipeline-bucket"
-    output_bucket_name = os.environ["OUTPUT_BUCKET"]
-    table = dynamodb.Table(table_name)
-    
+    # RECON / TRAIN stage logic:
     input_payload = event.get("input", {})
-    job_id = input_payload.get("jobId", str(uuid.uuid4()))
+    job_id = input_payload.get("jobId") or token_hex(16)
     container_name = input_payload.get("containerName", "nerfstudio")
     train_command = input_payload.get("trainCommand", "")
     
-    account_id = "975050048887"
-    region = "us-west-2"
-    ecr_uri = f"{account_id}.dkr.ecr.{region}.amazonaws.com/{container_name}:latest"
+    ecr_uri = _ECR_PREFIX + container_name + _ECR_SUFFIX
     
     if action == "RECON":
-        output_s3_uri = f"s3://{recon_bucket_name}/recon-outputs/"
+        output_s3_uri = _RECON_OUTPUT_URI
         job_prefix = "recon"
         s3_archive_name = input_payload.get("s3ArchiveName", "my-training-data")
-        input_s3_uri = f"s3://user-submissions/{s3_archive_name}"
+        input_s3_uri = _USER_SUBMISSIONS_PREFIX + s3_archive_name
     else:
-        output_s3_uri = f"s3://{output_bucket_name}/models/"
+        output_s3_uri = _MODEL_OUTPUT_URI
         job_prefix = "train"
-        recon_output_key = f"{job_id}-RECON-output"
-        input_s3_uri = f"s3://{recon_bucket_name}/recon-outputs/{recon_output_key}"
+        input_s3_uri = _RECON_OUTPUT_URI + job_id + "-RECON-output"
     
     training_job_name = f"{job_prefix}-job-{job_id}"
     
-    sagemaker.create_training_job(
-        TrainingJobName=training_job_name,
-        AlgorithmSpecification={
+    # The state machine calls sagemaker:createTrainingJob itself through its
+    # SDK integration; this Lambda only prepares the request.
+    training_job_request = {
+        **_TRAINING_JOB_TEMPLATE,
+        "TrainingJobName": training_job_name,
+        "AlgorithmSpecification": {
             "TrainingImage": ecr_uri,
-            "TrainingInputMode": "File",
+            # Mount the input prefix and stream objects from S3 on first read
+            # instead of downloading the whole dataset before the job starts
+            "TrainingInputMode": "FastFile",
             "ContainerEntrypoint": ["/bin/bash", "-c", train_command]
         },
-        RoleArn=role_arn,
-        InputDataConfig=[{
+        "InputDataConfig": [{
             "ChannelName": "training",
             "DataSource": {
                 "S3DataSource": {
@@ -97,49 +171,59 @@ def do_stage_logic(event, action):
                 }
             }
         }],
-        OutputDataConfig={"S3OutputPath": output_s3_uri},
-        ResourceConfig={
-            "InstanceType": "ml.p3.2xlarge",
-            "InstanceCount": 1,
-            "VolumeSizeInGB": 50
-        },
-        StoppingCondition={"MaxRuntimeInSeconds": 3600}
-    )
+        "OutputDataConfig": {"S3OutputPath": output_s3_uri}
+    }
     
-    table.put_item(
-        Item={
-            "jobId": job_id,
-            "stage": action,
-            "status": "IN_PROGRESS",
-            "sageMakerJobName": training_job_name,
-            "outputBucket": output_s3_uri
+    # Only the stage attributes are written, so later stages don't rewrite the
+    # whole item (and keep attributes such as taskToken intact). The previous
+    # stage's cached SageMaker description no longer applies.
+    dynamodb_client().update_item(
+        TableName=TABLE_NAME,
+        Key={"jobId": {"S": job_id}},
+        UpdateExpression="SET stage = :stage, #s = :status, sageMakerJobName = :name, outputBucket = :output REMOVE cachedDescription",
+        ExpressionAttributeNames={"#s": "status"},
+        ExpressionAttributeValues={
+            ":stage": {"S": action},
+            ":status": {"S": "IN_PROGRESS"},
+            ":name": {"S": training_job_name},
+            ":output": {"S": output_s3_uri}
         }
     )
     
     return {
         "statusCode": 200,
-        "message": f"{action} stage job started",
+        "message": f"{action} stage job prepared",
         "jobId": job_id,
         "containerUsed": ecr_uri,
         "inputData": input_s3_uri,
-        "trainingJobName": training_job_name
+        "trainingJobName": training_job_name,
+        "trainingJobRequest": training_job_request
     }
 
 
 
+def _write_start_row(dynamodb, item):
+    # Nothing orders this write before the RECON stage's update_item. If that
+    # landed first, a plain put would replace the row and drop the stage
+    # attributes, so only create the row when it doesn't exist yet.
+    try:
+        dynamodb.put_item(
+            TableName=TABLE_NAME,
+            Item=item,
+            ConditionExpression="attribute_not_exists(jobId)"
+        )
+    except dynamodb.exceptions.ConditionalCheckFailedException:
+        pass
+
 def start_job_logic(event):
     # Parse the incoming event body from API Gateway
-    body = {}
-    if "body" in event:
-        try:
-            body = json.loads(event["body"])
-        except Exception as e:
-            return {
-                "statusCode": 400,
-                "body": json.dumps({"error": "Invalid JSON body", "detail": str(e)})
-            }
-    else:
-        body = event
+    try:
+        body = _parse_body(event)
+    except ValueError as e:
+        return {
+            "statusCode": 400,
+            "body": json.dumps({"error": "Invalid JSON body", "detail": str(e)})
+        }
 
     # Extract parameters from the request
     recon_container = body.get("reconContainer", "colmap")
@@ -148,7 +232,7 @@ def start_job_logic(event):
     train_command = body.get("trainCommand", "")
     
     # Generate a new job ID
-    job_id = str(uuid.uuid4())
+    job_id = token_hex(16)
     
     # Compose input for the Step Functions state machine execution
     sfn_input = {
@@ -159,86 +243,124 @@ def start_job_logic(event):
         "trainCommand": train_command
     }
     
-    # Start execution of the state machine. Replace the placeholder ARN with your actual Step Functions ARN.
-    response = stepfunctions_client.start_execution(
-        stateMachineArn="arn:aws:states:us-west-2:975050048887:stateMachine:RenderingPipelineStateMachine39265931-vs5WJJdof6SW",
-        input=json.dumps(sfn_input)
-    )
+    # Optionally, store the job status in DynamoDB. The write doesn't depend on
+    # the start_execution response, so both calls run concurrently.
+    # Build both clients on this thread: the shared session is not thread-safe
+    dynamodb = dynamodb_client()
+    sfn = stepfunctions_client()
+    execution_arn = _EXECUTION_ARN_PREFIX + job_id
+    ddb_future = _EXECUTOR.submit(_write_start_row, dynamodb, {
+        "jobId": {"S": job_id},
+        "status": {"S": "STEP_FUNCTION_STARTED"},
+        "reconContainer": {"S": recon_container},
+        "trainContainer": {"S": train_container},
+        "executionArn": {"S": execution_arn}
+    })
     
-    # Optionally, store the job status in DynamoDB
-    table_name = os.environ["STATUS_TABLE"]
-    table = dynamodb.Table(table_name)
-    table.put_item(
-        Item={
-            "jobId": job_id,
-            "status": "STEP_FUNCTION_STARTED",
-            "reconContainer": recon_container,
-            "trainContainer": train_container,
-            "executionArn": response["executionArn"]
+    # Start execution of the state machine. Replace the placeholder ARN with your actual Step Functions ARN.
+    try:
+        sfn.start_execution(
+            stateMachineArn=STATE_MACHINE_ARN,
+            name=job_id,
+            input=json.dumps(sfn_input)
+        )
+    except Exception as e:
+        # exception() waits for the write without raising if it failed too
+        ddb_future.exception()
+        error_response = {
+            "statusCode": 500,
+            "body": json.dumps({"error": str(e)})
         }
-    )
+        # A read timeout can surface after the execution was created, so only
+        # drop the row once Step Functions confirms there is no execution
+        try:
+            sfn.describe_execution(executionArn=execution_arn)
+        except sfn.exceptions.ExecutionDoesNotExist:
+            try:
+                dynamodb.delete_item(TableName=TABLE_NAME, Key={"jobId": {"S": job_id}})
+            except Exception as delete_error:
+                print(f"Error deleting status row for job {job_id}: {delete_error}")
+            return error_response
+        except Exception:
+            # Can't tell whether the pipeline is running; keep the row
+            return error_response
+    write_error = ddb_future.exception()
+    if write_error:
+        # The pipeline is running and its stage writes recreate the row, so
+        # don't report a failure for a job that exists
+        print(f"Error writing status row for job {job_id}: {write_error}")
     
     return {
         "statusCode": 200,
-        "headers": {
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Headers": "*",
-            "Access-Control-Allow-Methods": "*"
-        },
-        "body": json.dumps({
-            "message": "Step Functions pipeline started",
-            "jobId": job_id,
-            "executionArn": response["executionArn"]
-        })
+        "headers": _CORS_HEADERS,
+        # jobId is a token_hex string and executionArn an AWS ARN, so neither
+        # needs JSON escaping; skip json.dumps on the hot path
+        "body": f'{{"message": "Step Functions pipeline started", "jobId": "{job_id}", "executionArn": "{execution_arn}"}}'
     }
 
 def stop_job_logic(event):
-    table_name = os.environ["STATUS_TABLE"]
-    table = dynamodb.Table(table_name)
-    body = {}
-    if "body" in event:
-        try:
-            body = json.loads(event["body"])
-        except:
-            pass
-    else:
-        body = event
+    try:
+        body = _parse_body(event)
+    except ValueError:
+        body = {}
     job_id = body.get("jobId", None)
     if not job_id:
         return {
             "statusCode": 400,
             "body": json.dumps({"error": "No jobId provided"})
         }
-    response = table.get_item(Key={"jobId": job_id})
-    item = response.get("Item", {})
-    training_job_name = item.get("sageMakerJobName", None)
-    if not training_job_name:
+    # Mark the job STOPPING and fetch its SageMaker job name in one round-trip
+    try:
+        response = dynamodb_client().update_item(
+            TableName=TABLE_NAME,
+            Key={"jobId": {"S": job_id}},
+            UpdateExpression="SET #s = :val",
+            ConditionExpression="attribute_exists(sageMakerJobName)",
+            ExpressionAttributeNames={"#s": "status"},
+            ExpressionAttributeValues={":val": {"S": "STOPPING"}},
+            ReturnValues="ALL_OLD"
+        )
+    except dynamodb_client().exceptions.ConditionalCheckFailedException:
         return {
             "statusCode": 400,
             "body": json.dumps({"error": "No matching job found in DynamoDB"})
         }
+    old_item = response["Attributes"]
+    training_job_name = old_item["sageMakerJobName"]["S"]
     try:
-        sagemaker.stop_training_job(TrainingJobName=training_job_name)
+        sagemaker_client().stop_training_job(TrainingJobName=training_job_name)
     except Exception as e:
+        # SageMaker refused (e.g. the job already finished): put the previous
+        # status back unless something else has changed it in the meantime.
+        # COMPLETED_RECON is not restored: with the row's taskToken it would
+        # match the stream filter and resend an already-used callback token.
+        if "status" in old_item and old_item["status"].get("S") != "COMPLETED_RECON":
+            try:
+                dynamodb_client().update_item(
+                    TableName=TABLE_NAME,
+                    Key={"jobId": {"S": job_id}},
+                    UpdateExpression="SET #s = :old",
+                    ConditionExpression="#s = :stopping",
+                    ExpressionAttributeNames={"#s": "status"},
+                    ExpressionAttributeValues={":old": old_item["status"], ":stopping": {"S": "STOPPING"}}
+                )
+            except dynamodb_client().exceptions.ConditionalCheckFailedException:
+                pass
         return {
             "statusCode": 500,
             "body": json.dumps({"error": str(e)})
         }
-    table.update_item(
-        Key={"jobId": job_id},
-        UpdateExpression="SET #s = :val",
-        ExpressionAttributeNames={"#s": "status"},
-        ExpressionAttributeValues={":val": "STOPPING"}
-    )
     return {
         "statusCode": 200,
-        "headers": {
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Headers": "*",
-            "Access-Control-Allow-Methods": "*"
-        },
+        "headers": _CORS_HEADERS,
         "body": json.dumps({
             "message": "Stopping job",
             "jobId": job_id
         })
     }
+
+# routeKey -> route handler for API Gateway invocations
+_ROUTES = {
+    "POST /start": start_job_logic,
+    "POST /stop": stop_job_logic,
+}
@@ -1,85 +1,262 @@
 import os
 import json
 import boto3
+import time
 import datetime
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.config import Config
 
-class DateTimeEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, datetime.datetime):
-            return obj.isoformat()
-        return super(DateTimeEncoder, self).default(obj)
+# describe_training_job responses contain datetimes
+def _encode_datetime(obj):
+    if isinstance(obj, datetime.datetime):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
 
-dynamodb = boto3.resource("dynamodb")
-sagemaker = boto3.client("sagemaker")
-stepfunctions = boto3.client('stepfunctions')  # added for callbacks
+def dumps_response(obj):
+    return json.dumps(obj, default=_encode_datetime)
+
+# Keep-alive so warm invocations reuse the pooled TLS connections
+_cfg = Config(
+    tcp_keepalive=True,
+    retries={"max_attempts": 3, "mode": "standard"},
+    connect_timeout=1,
+    read_timeout=3,
+    max_pool_connections=10
+)
+
+_TABLE_NAME = os.environ["STATUS_TABLE"]
+
+# Clients are built on first use: the stream branch only needs Step Functions
+# and the API branch only DynamoDB and SageMaker.
+@lru_cache(maxsize=None)
+def dynamodb_resource():
+    return boto3.resource("dynamodb", config=_cfg)
+
+@lru_cache(maxsize=None)
+def status_table():
+    return dynamodb_resource().Table(_TABLE_NAME)
+
+@lru_cache(maxsize=None)
+def sagemaker_client():
+    return boto3.client("sagemaker", config=_cfg)
+
+@lru_cache(maxsize=None)
+def stepfunctions_client():
+    return boto3.client("stepfunctions", config=_cfg)  # added for callbacks
+
+# SnapStart snapshots the environment after init: build every client before
+# the snapshot is taken so restored environments start with them ready.
+# Outside SnapStart the hook never runs and clients stay lazy.
+try:
+    from snapshot_restore_py import register_before_snapshot
+except ImportError:
+    register_before_snapshot = None
+
+if register_before_snapshot is not None:
+    @register_before_snapshot
+    def _init():
+        status_table()
+        sagemaker_client()
+        stepfunctions_client()
+
+# UIs poll /logs far more often than a training job changes state. Keying
+# the cache on a coarse time bucket expires entries every few seconds.
+DESCRIBE_CACHE_SECONDS = 3
+
+@lru_cache(maxsize=128)
+def _describe_training_job(job_name, time_bucket):
+    description = sagemaker_client().describe_training_job(TrainingJobName=job_name)
+    description.pop("ResponseMetadata", None)
+    return description
+
+# Once both the row and SageMaker report one of these, the description is
+# final and is cached on the row. COMPLETED_RECON is left out: the train stage
+# follows, and writing to such a row would emit a stream record that matches
+# the callback filter and resend the already-used task token.
+TERMINAL_DB_STATUSES = {"COMPLETED_TRAIN", "FAILED", "STOPPED"}
+TERMINAL_SAGEMAKER_STATUSES = {"Completed", "Failed", "Stopped"}
+
+# Shared across records and invocations; stream images arrive in DynamoDB's wire format
+_DESER = TypeDeserializer()
+# Only these attributes are read from a stream image; the rest (e.g. a cached
+# SageMaker description) are never deserialized
+_STREAM_FIELDS = ("jobId", "status", "taskToken")
+
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Headers": "*",
+    "Access-Control-Allow-Methods": "*"
+}
+
+BATCH_GET_LIMIT = 100
+BATCH_GET_MAX_RETRIES = 5
+# Each polled job may cost a SageMaker describe, all within the 10s timeout
+MAX_POLL_JOBS = 100
+# SageMaker describes for a multi-job poll run concurrently
+describe_executor = ThreadPoolExecutor(max_workers=10)
+
+# Step Functions has no bulk callback API, so stream batches send their
+# callbacks concurrently instead of one RTT after another
+callback_executor = ThreadPoolExecutor(max_workers=10)
+
+# Returns False when the callback failed and is worth retrying
+def send_callback(stepfunctions, job_id, task_token, status):
+    try:
+        stepfunctions.send_task_success(
+            taskToken=task_token,
+            output=json.dumps({"status": status, "jobId": job_id})
+        )
+        print(f"Callback sent for job {job_id} with token {task_token}")
+    except (stepfunctions.exceptions.TaskTimedOut,
+            stepfunctions.exceptions.InvalidToken,
+            stepfunctions.exceptions.TaskDoesNotExist) as e:
+        # The token can never be used again; retrying the record cannot help
+        print(f"Dropping callback for job {job_id}: {str(e)}")
+    except Exception as e:
+        print(f"Error sending callback for job {job_id}: {str(e)}")
+        return False
+    return True
 
 def handler(event, context):
     # Check if this is a DynamoDB Stream event (triggered by table updates)
     if "Records" in event:
-        # Process each record in the batch
+        # The event source mapping's FilterCriteria only delivers INSERT/MODIFY
+        # records whose NewImage has status COMPLETED_RECON and a taskToken
+        stepfunctions = stepfunctions_client()
+        callbacks = []
         for record in event["Records"]:
-            if record["eventName"] in ["INSERT", "MODIFY"]:
-                new_image = record["dynamodb"].get("NewImage", {})
-                job_id = new_image.get("jobId", {}).get("S")
-                status = new_image.get("status", {}).get("S")
-                # Assume we've stored a taskToken in the DB when the Step Functions wait started.
-                task_token = new_image.get("taskToken", {}).get("S")
-                
-                # Check if the update indicates that the Recon job is complete
-                if status == "COMPLETED_RECON" and task_token:
-                    try:
-                        stepfunctions.send_task_success(
-                            taskToken=task_token,
-                            output=json.dumps({"status": status, "jobId": job_id})
-                        )
-                        print(f"Callback sent for job {job_id} with token {task_token}")
-                    except Exception as e:
-                        print(f"Error sending callback for job {job_id}: {str(e)}")
-        # Return a simple acknowledgment for stream processing
-        return {"status": "stream processed"}
+            new_image = record["dynamodb"]["NewImage"]
+            job_id, status, task_token = (_DESER.deserialize(new_image[k]) for k in _STREAM_FIELDS)
+            callbacks.append(callback_executor.submit(send_callback, stepfunctions, job_id, task_token, status))
+        # Report failed callbacks so the event source mapping retries them
+        # (and eventually sends them to its DLQ) instead of dropping them
+        return {"batchItemFailures": [
+            {"itemIdentifier": record["dynamodb"]["SequenceNumber"]}
+            for record, callback in zip(event["Records"], callbacks)
+            if not callback.result()
+        ]}
     
     # Otherwise, assume this is an API Gateway invocation to get status/logs
-    table_name = os.environ["STATUS_TABLE"]
-    table = dynamodb.Table(table_name)
-    
     job_id = None
+    job_ids = None
     if "queryStringParameters" in event and event["queryStringParameters"]:
         job_id = event["queryStringParameters"].get("jobId")
+        if event["queryStringParameters"].get("jobIds"):
+            job_ids = event["queryStringParameters"]["jobIds"].split(",")
     else:
         if "body" in event:
             try:
                 body = json.loads(event["body"])
                 job_id = body.get("jobId")
+                job_ids = body.get("jobIds")
             except:
                 pass
 
+    if job_ids is not None:
+        if not isinstance(job_ids, list) or not job_ids or not all(isinstance(j, str) and j for j in job_ids):
+            return {
+                "statusCode": 400,
+                "body": dumps_response({"error": "jobIds must be a non-empty list of jobId strings."})
+            }
+        if len(job_ids) > MAX_POLL_JOBS:
+            return {
+                "statusCode": 400,
+                "body": dumps_response({"error": f"At most {MAX_POLL_JOBS} jobIds per request."})
+            }
+        return poll_jobs(job_ids)
+
     if not job_id:
         return {
             "statusCode": 400,
-            "body": json.dumps({"error": "Missing jobId parameter."})
+            "body": dumps_response({"error": "Missing jobId parameter."})
         }
     
+    table = status_table()
     result = table.get_item(Key={"jobId": job_id})
-    job_status_in_db = "UNKNOWN"
-    if "Item" in result:
-        job_status_in_db = result["Item"].get("status", "UNKNOWN")
-    
-    job_description = None
-    try:
-        job_name = f"nerf-training-{job_id}"
-        job_description = sagemaker.describe_training_job(TrainingJobName=job_name)
-    except sagemaker.exceptions.ClientError as e:
-        job_description = {"error": str(e)}
+    item = result.get("Item", {})
+    job_status_in_db = item.get("status", "UNKNOWN")
+    job_description, cache_description = describe_job(job_id, item)
+    if cache_description:
+        write_cached_description(table, job_id, job_description)
     
     return {
         "statusCode": 200,
-        "headers": {
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Headers": "*",
-            "Access-Control-Allow-Methods": "*"
-        },
-        "body": json.dumps({
+        "headers": CORS_HEADERS,
+        "body": dumps_response({
             "dbStatus": job_status_in_db,
             "sageMakerJobDescription": job_description
-        }, cls=DateTimeEncoder)
+        })
+    }
+
+def poll_jobs(job_ids):
+    # One BatchGetItem per 100 jobs instead of a get_item per job, and the
+    # SageMaker describes fanned out concurrently
+    job_ids = list(dict.fromkeys(job_ids))
+    table = status_table()
+    items = batch_get_jobs(job_ids)
+    sagemaker_client()  # build on this thread; the workers share it
+    descriptions = describe_executor.map(
+        lambda job_id: describe_job(job_id, items.get(job_id, {})), job_ids
+    )
+    
+    jobs = {}
+    for job_id, (job_description, cache_description) in zip(job_ids, descriptions):
+        if cache_description:
+            write_cached_description(table, job_id, job_description)
+        jobs[job_id] = {
+            "dbStatus": items.get(job_id, {}).get("status", "UNKNOWN"),
+            "sageMakerJobDescription": job_description
+        }
+    
+    return {
+        "statusCode": 200,
+        "headers": CORS_HEADERS,
+        "body": dumps_response({"jobs": jobs})
     }
+
+def batch_get_jobs(job_ids):
+    items = {}
+    for i in range(0, len(job_ids), BATCH_GET_LIMIT):
+        request_items = {_TABLE_NAME: {"Keys": [{"jobId": j} for j in job_ids[i:i + BATCH_GET_LIMIT]]}}
+        # Retry anything DynamoDB could not process with exponential backoff
+        for attempt in range(BATCH_GET_MAX_RETRIES):
+            response = dynamodb_resource().batch_get_item(RequestItems=request_items)
+            for item in response["Responses"].get(_TABLE_NAME, []):
+                items[item["jobId"]] = item
+            request_items = response.get("UnprocessedKeys")
+            if not request_items:
+                break
+            time.sleep(0.05 * (2 ** attempt))
+        else:
+            raise RuntimeError(f"Unprocessed DynamoDB reads after {BATCH_GET_MAX_RETRIES} attempts")
+    return items
+
+# Returns (description, whether it should be cached on the job's row)
+def describe_job(job_id, item):
+    job_status_in_db = item.get("status", "UNKNOWN")
+    # Terminal jobs no longer change, so serve the description cached on the row
+    # instead of asking SageMaker again on every poll
+    if job_status_in_db in TERMINAL_DB_STATUSES and "cachedDescription" in item:
+        return json.loads(item["cachedDescription"]), False
+    
+    job_name = item.get("sageMakerJobName")
+    if not job_name:
+        # No stage has started a SageMaker job for this row (or the row is missing)
+        return {"error": f"No SageMaker training job found for jobId {job_id}"}, False
+    sagemaker = sagemaker_client()
+    try:
+        job_description = _describe_training_job(job_name, int(time.time()) // DESCRIBE_CACHE_SECONDS)
+    except sagemaker.exceptions.ClientError as e:
+        return {"error": str(e)}, False
+    cache_description = (job_status_in_db in TERMINAL_DB_STATUSES
+                         and job_description.get("TrainingJobStatus") in TERMINAL_SAGEMAKER_STATUSES)
+    return job_description, cache_description
+
+def write_cached_description(table, job_id, job_description):
+    table.update_item(
+        Key={"jobId": job_id},
+        UpdateExpression="SET cachedDescription = :d",
+        ExpressionAttributeValues={":d": dumps_response(job_description)}
+    )
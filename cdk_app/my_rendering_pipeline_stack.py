@@ -4,8 +4,10 @@ from aws_cdk import (
     aws_s3 as s3,
     aws_lambda as _lambda,
     aws_iam as iam,
-    aws_apigateway as apigw,
+    aws_apigatewayv2 as apigwv2,
+    aws_apigatewayv2_integrations as apigwv2_integrations,
     aws_dynamodb as dynamodb,
+    aws_sqs as sqs,
     CfnOutput,
 )
 from constructs import Construct
@@ -21,8 +23,8 @@ class MyRenderingPipelineStack(Stack):
       - A DynamoDB table for tracking job statuses
       - A Lambda function that triggers SageMaker training
       - A Lambda function that retrieves logs / job status
-      - An API Gateway with:
-         * Root route for the training Lambda
+      - An API Gateway HTTP API with:
+         * POST /start and POST /stop routes for the training Lambda
          * /logs route for the logs Lambda
          * CORS enabled for any origin (pre-production)
     """
@@ -63,25 +65,50 @@ class MyRenderingPipelineStack(Stack):
                 type=dynamodb.AttributeType.STRING
             ),
             removal_policy=RemovalPolicy.DESTROY,
-            stream=dynamodb.StreamViewType.NEW_AND_OLD_IMAGES
+            stream=dynamodb.StreamViewType.NEW_AND_OLD_IMAGES,
+            # Sporadic, bursty job traffic: pay per request instead of provisioning
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST
         )
 
 
+        # Execution role passed to every SageMaker training job. The training
+        # Lambda receives it via SAGEMAKER_ROLE_ARN and reads it once at import.
+        sagemaker_role_arn = "arn:aws:iam::975050048887:role/MySageMakerExecutionRole"
+
+        # Training jobs started by the pipeline are named recon-job-<jobId> / train-job-<jobId>
+        training_job_arns = [
+            f"arn:aws:sagemaker:{self.region}:{self.account}:training-job/recon-job-*",
+            f"arn:aws:sagemaker:{self.region}:{self.account}:training-job/train-job-*",
+        ]
+
         # 4) CREATE THE TRAINING LAMBDA (TRIGGERS SAGEMAKER)
         training_lambda = _lambda.Function(
             self,
             "Lambda-RenderingPipeline",
             function_name="Lambda-RenderingPipeline",
-            runtime=_lambda.Runtime.PYTHON_3_9,
+            runtime=_lambda.Runtime.PYTHON_3_12,
+            architecture=_lambda.Architecture.ARM_64,
             handler="handler.handler",
             code=_lambda.Code.from_asset("lambda"),
             environment={
                 "OUTPUT_BUCKET": output_bucket.bucket_name,
                 "STATUS_TABLE": table.table_name,
-                "SAGEMAKER_ROLE_ARN": "arn:aws:iam::975050048887:role/MySageMakerExecutionRole"
+                "SAGEMAKER_ROLE_ARN": sagemaker_role_arn
             },
-            timeout=None,
-            memory_size=2048
+            # I/O-bound orchestration: a few AWS API calls, no heavy compute
+            timeout=Duration.seconds(15),
+            memory_size=256
+        )
+
+        # /start is user-interactive, so keep one pre-initialised instance behind
+        # the alias that API Gateway and Step Functions invoke. (Provisioned
+        # concurrency and SnapStart can't be combined on the same version.)
+        training_lambda_alias = _lambda.Alias(
+            self,
+            "Lambda-RenderingPipeline-Live",
+            alias_name="live",
+            version=training_lambda.current_version,
+            provisioned_concurrent_executions=1
         )
 
 
@@ -93,38 +120,27 @@ class MyRenderingPipelineStack(Stack):
         output_bucket.grant_read_write(training_lambda)
         recon_bucket.grant_read_write(training_lambda)
         table.grant_read_write_data(training_lambda)
+        # The Lambda only stops jobs itself; Step Functions creates them and the
+        # SageMaker execution role pulls images and writes logs
         training_lambda.role.add_to_principal_policy(
             iam.PolicyStatement(
-                actions=[
-                    "sagemaker:CreateTrainingJob",
-                    "sagemaker:DescribeTrainingJob",
-                    "sagemaker:StopTrainingJob",
-                    "sagemaker:ListTrainingJobs",
-                    "sagemaker:CreateModel",
-                    "sagemaker:DescribeModel",
-                    "sagemaker:DeleteModel",
-                    "ecr:GetAuthorizationToken",
-                    "ecr:BatchGetImage",
-                    "ecr:GetDownloadUrlForLayer",
-                    "logs:CreateLogGroup",
-                    "logs:CreateLogStream",
-                    "logs:PutLogEvents"
-                ],
-                resources=["*"]
+                actions=["sagemaker:StopTrainingJob"],
+                resources=training_job_arns
             )
         )
 
         training_lambda.role.add_to_principal_policy(
             iam.PolicyStatement(
-                actions=["iam:PassRole"],
-                resources=["arn:aws:iam::975050048887:role/MySageMakerExecutionRole"]
+                actions=["states:StartExecution"],
+                resources=["arn:aws:states:us-west-2:975050048887:stateMachine:RenderingPipelineStateMachine39265931-vs5WJJdof6SW"]
             )
         )
-
+        # Lets /start check whether a start_execution that raised still created
+        # the execution before it cleans up the job's row
         training_lambda.role.add_to_principal_policy(
             iam.PolicyStatement(
-                actions=["states:StartExecution"],
-                resources=["arn:aws:states:us-west-2:975050048887:stateMachine:RenderingPipelineStateMachine39265931-vs5WJJdof6SW"]
+                actions=["states:DescribeExecution"],
+                resources=["arn:aws:states:us-west-2:975050048887:execution:RenderingPipelineStateMachine39265931-vs5WJJdof6SW:*"]
             )
         )
         
@@ -133,20 +149,63 @@ class MyRenderingPipelineStack(Stack):
             self,
             "Lambda-RenderingPipeline-Logs",
             function_name="Lambda-RenderingPipeline-Logs",
-            runtime=_lambda.Runtime.PYTHON_3_9,
+            runtime=_lambda.Runtime.PYTHON_3_12,
+            architecture=_lambda.Architecture.ARM_64,
             handler="handler.handler",  # "handler.py" inside the 'logs' folder
             code=_lambda.Code.from_asset("lambda/logs"),
             environment={
                 "STATUS_TABLE": table.table_name,
             },
-            timeout=Duration.seconds(30),
-            memory_size=1024
+            timeout=Duration.seconds(10),
+            memory_size=256,
+            # Restore published versions from a snapshot instead of cold-initialising
+            snap_start=_lambda.SnapStartConf.ON_PUBLISHED_VERSIONS
+        )
+
+        # SnapStart only applies to published versions, so callers go through an alias
+        logs_lambda_alias = _lambda.Alias(
+            self,
+            "Lambda-RenderingPipeline-Logs-Live",
+            alias_name="live",
+            version=logs_lambda.current_version
         )
         
-        logs_lambda.add_event_source(lambda_events.DynamoEventSource(
+        # Records the logs Lambda gave up on, kept for inspection
+        stream_dlq = sqs.Queue(
+            self,
+            "SQS-RenderingPipeline-StreamDLQ",
+            retention_period=Duration.days(14),
+            removal_policy=RemovalPolicy.DESTROY
+        )
+
+        # Stream records go through the alias too, so they also start from the snapshot
+        logs_lambda_alias.add_event_source(lambda_events.DynamoEventSource(
             table,
             starting_position=_lambda.StartingPosition.LATEST,
-            batch_size=1  # process one record at a time
+            # Status changes come in flurries; collect up to 10 records per invocation
+            batch_size=10,
+            max_batching_window=Duration.seconds(2),
+            # Only effective because the handler reports failed records (see
+            # report_batch_item_failures below): a failing batch is split so one
+            # bad record doesn't hold up the rest
+            bisect_batch_on_error=True,
+            # The handler reports records whose callback failed; those are
+            # retried a few times, then parked in the DLQ
+            report_batch_item_failures=True,
+            retry_attempts=3,
+            max_record_age=Duration.hours(1),
+            on_failure=lambda_events.SqsDlq(stream_dlq),
+            # Only completed recon jobs with a stored task token need a callback;
+            # drop every other record before it reaches the Lambda
+            filters=[_lambda.FilterCriteria.filter({
+                "eventName": _lambda.FilterRule.or_("INSERT", "MODIFY"),
+                "dynamodb": {
+                    "NewImage": {
+                        "status": {"S": _lambda.FilterRule.is_equal("COMPLETED_RECON")},
+                        "taskToken": {"S": _lambda.FilterRule.exists()}
+                    }
+                }
+            })]
         ))
 
         logs_lambda.role.add_managed_policy(
@@ -160,65 +219,48 @@ class MyRenderingPipelineStack(Stack):
                     "sagemaker:DescribeTrainingJob",
                     # if your logs function might call other sagemaker actions, list them here
                 ],
-                resources=["*"]
+                resources=training_job_arns
             )
         )
 
         # 6) CREATE AN API GATEWAY
-        # We'll set up a root route for the training Lambda
-        # and add an extra resource /logs for the logs Lambda
+        # An HTTP API (v2) with explicit routes: POST /start and POST /stop go
+        # to the training Lambda, /logs goes to the logs Lambda.
         # We'll also enable open CORS for now (*)
-        api = apigw.RestApi(
+        api = apigwv2.HttpApi(
             self,
             "APIGateway-RenderingPipeline",
-            rest_api_name="APIGateway-RenderingPipeline",
-            deploy_options=apigw.StageOptions(stage_name="prod"),
-            default_cors_preflight_options=apigw.CorsOptions(
-                allow_origins=apigw.Cors.ALL_ORIGINS,
-                allow_methods=apigw.Cors.ALL_METHODS,
-                allow_headers=apigw.Cors.DEFAULT_HEADERS,
+            api_name="APIGateway-RenderingPipeline",
+            cors_preflight=apigwv2.CorsPreflightOptions(
+                allow_origins=["*"],
+                allow_methods=[apigwv2.CorsHttpMethod.ANY],
+                allow_headers=["*"],
             )
         )
 
-
-        # Enable open CORS on entire API
-        # for demonstration purposes—this is often more permissive than a production scenario
-        api.add_gateway_response(
-            "Default4XX",
-            type=apigw.ResponseType.DEFAULT_4_XX,
-            response_headers={
-                "Access-Control-Allow-Origin": "'*'",
-                "Access-Control-Allow-Headers": "'*'",
-                "Access-Control-Allow-Methods": "'*'"
-            }
+        training_integration = apigwv2_integrations.HttpLambdaIntegration(
+            "TrainingIntegration", training_lambda_alias
         )
-        api.add_gateway_response(
-            "Default5XX",
-            type=apigw.ResponseType.DEFAULT_5_XX,
-            response_headers={
-                "Access-Control-Allow-Origin": "'*'",
-                "Access-Control-Allow-Headers": "'*'",
-                "Access-Control-Allow-Methods": "'*'"
-            }
+        logs_integration = apigwv2_integrations.HttpLambdaIntegration(
+            "LogsIntegration", logs_lambda_alias
         )
 
-        # Root integration for training Lambda
-        training_integration = apigw.LambdaIntegration(training_lambda)
-        api.root.add_method("ANY", training_integration)
-
-        # Create /start resource for training Lambda
-        start_resource = api.root.add_resource("start")
-        start_resource.add_method("ANY", training_integration)
-
-
-        # /logs resource for logs Lambda
-        logs_integration = apigw.LambdaIntegration(logs_lambda)
-        logs_resource = api.root.add_resource("logs")
-        logs_resource.add_method("ANY", logs_integration)
-        
-        # /stop resource for training Lambda
-        stop_resource = api.root.add_resource("stop")
-        stop_resource.add_method("ANY", training_integration)
+        api.add_routes(
+            path="/start",
+            methods=[apigwv2.HttpMethod.POST],
+            integration=training_integration
+        )
+        api.add_routes(
+            path="/stop",
+            methods=[apigwv2.HttpMethod.POST],
+            integration=training_integration
+        )
+        # The logs Lambda reads jobId from the query string or a JSON body
+        api.add_routes(
+            path="/logs",
+            methods=[apigwv2.HttpMethod.GET, apigwv2.HttpMethod.POST],
+            integration=logs_integration
+        )
         
         ####################################
         # 7) STEP FUNCTIONS
@@ -235,7 +277,7 @@ class MyRenderingPipelineStack(Stack):
         recon_task = tasks.LambdaInvoke(
             self,
             "RunReconStage",
-            lambda_function=training_lambda,
+            lambda_function=training_lambda_alias,
             payload=sfn.TaskInput.from_object({
                 "action": "RECON",
                 "input.$": "$"
@@ -245,22 +287,90 @@ class MyRenderingPipelineStack(Stack):
                  "message.$": "$.Payload.message",
                  "containerUsed.$": "$.Payload.containerUsed",
                  "inputData.$": "$.Payload.inputData",
-                 "trainingJobName.$": "$.Payload.trainingJobName"
+                 "trainingJobName.$": "$.Payload.trainingJobName",
+                 "trainingJobRequest.$": "$.Payload.trainingJobRequest"
             },
             result_path="$.reconOutput"
         )
         
-        # NEW: UpdateToken Task now uses WAIT_FOR_TASK_TOKEN integration.
-        update_token_task = tasks.LambdaInvoke(
+        # The Lambda only prepares the CreateTrainingJob request; Step Functions
+        # calls SageMaker directly so the Lambda isn't billed for that round-trip.
+        def create_training_job_task(construct_id, stage_output_path, result_path):
+            request_path = f"{stage_output_path}.trainingJobRequest"
+            task = tasks.CallAwsService(
+                self,
+                construct_id,
+                service="sagemaker",
+                action="createTrainingJob",
+                parameters={
+                    "TrainingJobName": sfn.JsonPath.string_at(f"{request_path}.TrainingJobName"),
+                    "RoleArn": sfn.JsonPath.string_at(f"{request_path}.RoleArn"),
+                    "AlgorithmSpecification": sfn.JsonPath.object_at(f"{request_path}.AlgorithmSpecification"),
+                    "InputDataConfig": sfn.JsonPath.list_at(f"{request_path}.InputDataConfig"),
+                    "OutputDataConfig": sfn.JsonPath.object_at(f"{request_path}.OutputDataConfig"),
+                    "ResourceConfig": sfn.JsonPath.object_at(f"{request_path}.ResourceConfig"),
+                    "StoppingCondition": sfn.JsonPath.object_at(f"{request_path}.StoppingCondition"),
+                },
+                iam_resources=training_job_arns,
+                additional_iam_statements=[
+                    iam.PolicyStatement(
+                        actions=["iam:PassRole"],
+                        resources=[sagemaker_role_arn]
+                    )
+                ],
+                result_path=result_path
+            )
+            # Throttled control-plane calls are retried here, with backoff,
+            # rather than in a client-side retry loop. SageMaker does not model
+            # ThrottlingException, so the SDK integration reports it (like any
+            # unmodeled error) as AmazonSageMakerException; the error code is
+            # only in the Cause.
+            task.add_retry(
+                errors=["SageMaker.AmazonSageMakerException"],
+                interval=Duration.seconds(2),
+                max_attempts=3,
+                backoff_rate=2
+            )
+            # The stage Lambda has already marked the row IN_PROGRESS; if SageMaker
+            # rejects the job, record that before failing the execution. The row is
+            # keyed on the stage output's jobId, which the Lambda generates when
+            # the execution input has none.
+            mark_failed = tasks.DynamoUpdateItem(
+                self,
+                f"{construct_id}MarkFailed",
+                table=table,
+                key={"jobId": tasks.DynamoAttributeValue.from_string(sfn.JsonPath.string_at(f"{stage_output_path}.jobId"))},
+                update_expression="SET #s = :failed",
+                expression_attribute_names={"#s": "status"},
+                expression_attribute_values={":failed": tasks.DynamoAttributeValue.from_string("FAILED")},
+                result_path=sfn.JsonPath.DISCARD
+            )
+            task.add_catch(
+                mark_failed.next(sfn.Fail(self, f"{construct_id}Failed", cause="CreateTrainingJob failed")),
+                result_path="$.error"
+            )
+            return task
+        
+        create_recon_job_task = create_training_job_task(
+            "CreateReconTrainingJob", "$.reconOutput", "$.reconJob"
+        )
+        
+        # Store the task token on the job's row and wait for the recon worker's
+        # callback. A direct DynamoDB SDK call replaces a Lambda invocation whose
+        # only job was to write the token.
+        update_token_task = tasks.CallAwsService(
             self,
             "UpdateTaskToken",
-            lambda_function=training_lambda,
+            service="dynamodb",
+            action="updateItem",
             integration_pattern=sfn.IntegrationPattern.WAIT_FOR_TASK_TOKEN,
-            payload=sfn.TaskInput.from_object({
-                "action": "UPDATE_TOKEN",
-                "jobId.$": "$.reconOutput.jobId",
-                "taskToken.$": sfn.JsonPath.string_at("$$.Task.Token")
-            }),
+            parameters={
+                "TableName": table.table_name,
+                "Key": {"jobId": {"S": sfn.JsonPath.string_at("$.reconOutput.jobId")}},
+                "UpdateExpression": "SET taskToken = :token",
+                "ExpressionAttributeValues": {":token": {"S": sfn.JsonPath.task_token}}
+            },
+            iam_resources=[table.table_arn],
             result_path="$.updateTokenResult"
         )
         
@@ -268,16 +378,32 @@ class MyRenderingPipelineStack(Stack):
         train_task = tasks.LambdaInvoke(
             self,
             "RunTrainStage",
-            lambda_function=training_lambda,
+            lambda_function=training_lambda_alias,
             payload=sfn.TaskInput.from_object({
                 "action": "TRAIN",
                 "input.$": "$"
             }),
+            result_selector={
+                 "jobId.$": "$.Payload.jobId",
+                 "message.$": "$.Payload.message",
+                 "trainingJobName.$": "$.Payload.trainingJobName",
+                 "trainingJobRequest.$": "$.Payload.trainingJobRequest"
+            },
             result_path="$.trainOutput"
         )
         
-        # New definition: Recon -> UpdateToken (which waits for callback) -> Train
-        definition = recon_task.next(update_token_task).next(train_task)
+        create_train_job_task = create_training_job_task(
+            "CreateTrainTrainingJob", "$.trainOutput", "$.trainJob"
+        )
+        
+        # Recon -> CreateTrainingJob -> UpdateToken (which waits for callback) -> Train -> CreateTrainingJob
+        definition = (
+            recon_task
+            .next(create_recon_job_task)
+            .next(update_token_task)
+            .next(train_task)
+            .next(create_train_job_task)
+        )
 
 
         # Create a CloudWatch Log Group for Step Functions logs
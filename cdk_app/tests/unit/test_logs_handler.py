@@ -0,0 +1,137 @@
+import importlib.util
+import json
+import os
+
+import pytest
+
+HANDLER_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "lambda", "logs", "handler.py")
+
+
+@pytest.fixture
+def logs_handler(monkeypatch):
+    monkeypatch.setenv("STATUS_TABLE", "jobs")
+    spec = importlib.util.spec_from_file_location("logs_handler", HANDLER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class FakeResource:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def batch_get_item(self, RequestItems):
+        self.requests.append(RequestItems)
+        return self.responses.pop(0)
+
+
+class FakeSageMaker:
+    class exceptions:
+        ClientError = Exception
+
+    def __init__(self):
+        self.described = []
+
+    def describe_training_job(self, TrainingJobName):
+        self.described.append(TrainingJobName)
+        return {"TrainingJobName": TrainingJobName, "TrainingJobStatus": "InProgress"}
+
+
+def api_event(body):
+    return {"body": json.dumps(body)}
+
+
+def test_job_ids_must_be_a_list_of_strings(logs_handler):
+    for job_ids in ("abc", [1, 2], [], ["a", ""]):
+        response = logs_handler.handler(api_event({"jobIds": job_ids}), None)
+        assert response["statusCode"] == 400
+
+
+def test_job_ids_are_capped(logs_handler):
+    job_ids = [f"job-{i}" for i in range(logs_handler.MAX_POLL_JOBS + 1)]
+    response = logs_handler.handler(api_event({"jobIds": job_ids}), None)
+    assert response["statusCode"] == 400
+
+
+def test_poll_jobs(logs_handler, monkeypatch):
+    resource = FakeResource([{"Responses": {"jobs": [
+        {"jobId": "a", "status": "IN_PROGRESS", "sageMakerJobName": "train-job-a"},
+        {"jobId": "b", "status": "FAILED", "cachedDescription": '{"TrainingJobStatus": "Failed"}'},
+    ]}}])
+    sagemaker = FakeSageMaker()
+    monkeypatch.setattr(logs_handler, "dynamodb_resource", lambda: resource)
+    monkeypatch.setattr(logs_handler, "status_table", lambda: None)
+    monkeypatch.setattr(logs_handler, "sagemaker_client", lambda: sagemaker)
+
+    response = logs_handler.handler(api_event({"jobIds": ["a", "b", "a", "c"]}), None)
+
+    assert response["statusCode"] == 200
+    jobs = json.loads(response["body"])["jobs"]
+    assert list(jobs) == ["a", "b", "c"]
+    assert jobs["a"]["sageMakerJobDescription"]["TrainingJobName"] == "train-job-a"
+    assert jobs["b"]["sageMakerJobDescription"] == {"TrainingJobStatus": "Failed"}
+    assert jobs["c"]["dbStatus"] == "UNKNOWN"
+    assert "error" in jobs["c"]["sageMakerJobDescription"]
+    # Only the job with a recorded name and no cached description hits SageMaker
+    assert sagemaker.described == ["train-job-a"]
+    assert len(resource.requests) == 1
+
+
+def test_batch_get_jobs_raises_on_unprocessed_keys(logs_handler, monkeypatch):
+    unprocessed = {"jobs": {"Keys": [{"jobId": "a"}]}}
+    resource = FakeResource(
+        [{"Responses": {}, "UnprocessedKeys": unprocessed}] * logs_handler.BATCH_GET_MAX_RETRIES
+    )
+    monkeypatch.setattr(logs_handler, "dynamodb_resource", lambda: resource)
+    monkeypatch.setattr(logs_handler.time, "sleep", lambda seconds: None)
+
+    with pytest.raises(RuntimeError):
+        logs_handler.batch_get_jobs(["a"])
+
+
+class FakeStepFunctions:
+    class exceptions:
+        class TaskTimedOut(Exception):
+            pass
+
+        class InvalidToken(Exception):
+            pass
+
+        class TaskDoesNotExist(Exception):
+            pass
+
+    def __init__(self, errors):
+        self.errors = errors
+
+    def send_task_success(self, taskToken, output):
+        if taskToken in self.errors:
+            raise self.errors[taskToken]
+
+
+def stream_record(sequence_number, job_id, task_token):
+    return {"dynamodb": {
+        "SequenceNumber": sequence_number,
+        "NewImage": {
+            "jobId": {"S": job_id},
+            "status": {"S": "COMPLETED_RECON"},
+            "taskToken": {"S": task_token},
+        },
+    }}
+
+
+def test_stream_reports_only_retryable_callback_failures(logs_handler, monkeypatch):
+    stepfunctions = FakeStepFunctions({
+        "expired": FakeStepFunctions.exceptions.TaskTimedOut(),
+        "throttled": RuntimeError("Rate exceeded"),
+    })
+    monkeypatch.setattr(logs_handler, "stepfunctions_client", lambda: stepfunctions)
+    event = {"Records": [
+        stream_record("1", "a", "ok"),
+        stream_record("2", "b", "expired"),
+        stream_record("3", "c", "throttled"),
+    ]}
+
+    response = logs_handler.handler(event, None)
+
+    assert response == {"batchItemFailures": [{"itemIdentifier": "3"}]}
@@ -0,0 +1,156 @@
+import importlib.util
+import json
+import os
+import threading
+
+import pytest
+
+HANDLER_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "lambda", "handler.py")
+
+
+def load_handler(monkeypatch):
+    monkeypatch.setenv("STATUS_TABLE", "jobs")
+    monkeypatch.setenv("OUTPUT_BUCKET", "output")
+    monkeypatch.setenv("SAGEMAKER_ROLE_ARN", "arn:aws:iam::123456789012:role/sagemaker")
+    spec = importlib.util.spec_from_file_location("training_handler", HANDLER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def training_handler(monkeypatch):
+    monkeypatch.delenv("AWS_LAMBDA_INITIALIZATION_TYPE", raising=False)
+    return load_handler(monkeypatch)
+
+
+class FakeDynamoDB:
+    class exceptions:
+        class ConditionalCheckFailedException(Exception):
+            pass
+
+    def __init__(self, before_put=None, delete_error=None):
+        self.items = {}
+        self.before_put = before_put
+        self.delete_error = delete_error
+
+    def put_item(self, TableName, Item, ConditionExpression=None):
+        if self.before_put:
+            self.before_put()
+        job_id = Item["jobId"]["S"]
+        if ConditionExpression == "attribute_not_exists(jobId)" and job_id in self.items:
+            raise self.exceptions.ConditionalCheckFailedException()
+        self.items[job_id] = dict(Item)
+
+    def update_item(self, TableName, Key, UpdateExpression, ExpressionAttributeValues,
+                    ExpressionAttributeNames=None, **kwargs):
+        # Understands the "SET a = :x, #b = :y [REMOVE ...]" form do_stage_logic uses
+        names = ExpressionAttributeNames or {}
+        item = self.items.setdefault(Key["jobId"]["S"], dict(Key))
+        for assignment in UpdateExpression.split(" REMOVE ")[0][len("SET "):].split(", "):
+            name, value = assignment.split(" = ")
+            item[names.get(name, name)] = ExpressionAttributeValues[value]
+
+    def delete_item(self, TableName, Key):
+        if self.delete_error:
+            raise self.delete_error
+        self.items.pop(Key["jobId"]["S"], None)
+
+
+class FakeStepFunctions:
+    class exceptions:
+        class ExecutionDoesNotExist(Exception):
+            pass
+
+    def __init__(self, on_start=None, start_error=None, execution_exists=True):
+        self.on_start = on_start
+        self.start_error = start_error
+        self.execution_exists = execution_exists
+
+    def start_execution(self, stateMachineArn, name, input):
+        if self.on_start:
+            self.on_start(json.loads(input))
+        if self.start_error:
+            raise self.start_error
+        return {"executionArn": f"{stateMachineArn}:{name}"}
+
+    def describe_execution(self, executionArn):
+        if not self.execution_exists:
+            raise self.exceptions.ExecutionDoesNotExist()
+        return {"executionArn": executionArn, "status": "RUNNING"}
+
+
+def use_clients(module, monkeypatch, dynamodb, stepfunctions):
+    monkeypatch.setattr(module, "dynamodb_client", lambda: dynamodb)
+    monkeypatch.setattr(module, "stepfunctions_client", lambda: stepfunctions)
+
+
+def start(module):
+    return module.handler({"routeKey": "POST /start", "body": "{}"}, None)
+
+
+def test_late_start_write_keeps_stage_attributes(training_handler, monkeypatch):
+    stage_written = threading.Event()
+    dynamodb = FakeDynamoDB(before_put=lambda: stage_written.wait(5))
+
+    def run_recon_stage(sfn_input):
+        # The RECON stage updates the row before the /start put lands
+        training_handler.do_stage_logic({"input": sfn_input}, "RECON")
+        stage_written.set()
+
+    use_clients(training_handler, monkeypatch, dynamodb, FakeStepFunctions(on_start=run_recon_stage))
+
+    response = start(training_handler)
+
+    assert response["statusCode"] == 200
+    job_id = json.loads(response["body"])["jobId"]
+    row = dynamodb.items[job_id]
+    assert row["status"] == {"S": "IN_PROGRESS"}
+    assert row["stage"] == {"S": "RECON"}
+    assert row["sageMakerJobName"] == {"S": f"recon-job-{job_id}"}
+
+
+def test_failed_start_deletes_row(training_handler, monkeypatch):
+    dynamodb = FakeDynamoDB()
+    stepfunctions = FakeStepFunctions(start_error=RuntimeError("boom"), execution_exists=False)
+    use_clients(training_handler, monkeypatch, dynamodb, stepfunctions)
+
+    response = start(training_handler)
+
+    assert response["statusCode"] == 500
+    assert dynamodb.items == {}
+
+
+def test_failed_delete_still_returns_error_body(training_handler, monkeypatch):
+    dynamodb = FakeDynamoDB(delete_error=RuntimeError("delete failed"))
+    stepfunctions = FakeStepFunctions(start_error=RuntimeError("boom"), execution_exists=False)
+    use_clients(training_handler, monkeypatch, dynamodb, stepfunctions)
+
+    response = start(training_handler)
+
+    assert response["statusCode"] == 500
+    assert json.loads(response["body"]) == {"error": "boom"}
+
+
+def test_start_error_after_execution_was_created(training_handler, monkeypatch):
+    dynamodb = FakeDynamoDB()
+    stepfunctions = FakeStepFunctions(start_error=TimeoutError("read timeout"), execution_exists=True)
+    use_clients(training_handler, monkeypatch, dynamodb, stepfunctions)
+
+    response = start(training_handler)
+
+    assert response["statusCode"] == 200
+    job_id = json.loads(response["body"])["jobId"]
+    assert dynamodb.items[job_id]["status"] == {"S": "STEP_FUNCTION_STARTED"}
+
+
+def test_clients_stay_lazy_on_demand(training_handler):
+    assert training_handler._botocore.cache_info().currsize == 0
+
+
+def test_provisioned_instances_build_clients_at_load(monkeypatch):
+    monkeypatch.setenv("AWS_LAMBDA_INITIALIZATION_TYPE", "provisioned-concurrency")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-west-2")
+    module = load_handler(monkeypatch)
+    for client_factory in (module.dynamodb_client, module.stepfunctions_client, module.sagemaker_client):
+        assert client_factory.cache_info().currsize == 1